@@ -4,105 +4,455 @@ HTTP Bridge for MCP Server
 Connects HTTP/SSE transport to the existing Node.js MCP server via stdio
 """
 import asyncio
-import json
+import itertools
 import logging
-import subprocess
+import os
 import argparse
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable, Tuple
+import orjson
 from http_transport import HTTPTransport, HTTPTransportConfig
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class MCPWorker:
+    """A single Node.js MCP server process and its stdio plumbing."""
+    
+    # How long the writer waits to coalesce queued messages into one write
+    batch_window = 0.001
+    # How long the server gets to exit after SIGTERM before it is killed
+    stop_timeout = 5.0
+    # How long a request may wait for its response before giving up
+    request_timeout = 300.0
+    # Longest line read from the server; tool results can carry whole files
+    max_line = 64 * 1024 * 1024
+    
+    def __init__(
+        self, server_path: str, on_message: Optional[Callable] = None,
+        on_close: Optional[Callable] = None
+    ):
+        self.server_path = server_path
+        # Called with (worker, message) for server-initiated messages
+        self.on_message = on_message
+        # Called with the worker once its server can no longer be read
+        self.on_close = on_close
+        self.process: Optional[asyncio.subprocess.Process] = None
+        # In-flight requests keyed by the JSON-RPC id sent to the server
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self._next_id = itertools.count(1)
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._closed = False
+        
+    @property
+    def in_flight(self) -> int:
+        """Number of requests awaiting a response from this worker."""
+        return len(self._pending)
+        
+    @property
+    def alive(self) -> bool:
+        """Whether the server process is still running and readable."""
+        return (
+            not self._closed
+            and self.process is not None
+            and self.process.returncode is None
+        )
+        
+    async def start(self):
+        """Start the Node.js MCP server process."""
+        # asyncio pipes are unbuffered on our side, and Node hands each
+        # process.stdout.write() to the pipe without a userland buffer, so
+        # responses are delivered as soon as they are written. Keep Node
+        # from treating the pipes as an interactive terminal.
+        self.process = await asyncio.create_subprocess_exec(
+            "node", "--unhandled-rejections=strict", self.server_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=self.max_line,
+            env={**os.environ, "NODE_NO_READLINE": "1", "FORCE_COLOR": "0"}
+        )
+        self._reader_task = asyncio.create_task(self._read_responses())
+        self._writer_task = asyncio.create_task(self._write_batches())
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+        
+    def _resolve(self, request_id: Any, response: Tuple[Dict, Optional[bytes]]):
+        """Complete the pending request with the given id, if any."""
+        future = self._pending.pop(request_id, None)
+        if future and not future.done():
+            future.set_result(response)
+            
+    async def _read_responses(self):
+        """Route responses from the MCP server to their waiting requests."""
+        try:
+            while True:
+                response_line = await self.process.stdout.readline()
+                if not response_line:
+                    break
+                try:
+                    message = orjson.loads(response_line)
+                except orjson.JSONDecodeError:
+                    logger.warning("Ignoring non-JSON output: %r", response_line)
+                    continue
+                # Batch responses arrive as an array and can't be passed through
+                if not isinstance(message, list):
+                    message, raw = [message], response_line
+                else:
+                    raw = None
+                for response in message:
+                    if not isinstance(response, dict):
+                        logger.warning("Ignoring non-object output: %r", response)
+                    # Server-initiated requests also carry ids, but have a method
+                    elif "method" not in response:
+                        if response.get("id") in self._pending:
+                            self._resolve(response["id"], (response, raw))
+                        else:
+                            # Late replies to abandoned requests belong to
+                            # one client, so never publish them
+                            logger.warning(
+                                "Dropping response to unknown request id %r",
+                                response.get("id")
+                            )
+                    elif self.on_message:
+                        self.on_message(self, response)
+        except Exception as e:
+            # Responses can no longer be matched up, so retire the server
+            logger.error("Error reading from MCP server: %s", e)
+            if self.process.returncode is None:
+                self.process.terminate()
+        finally:
+            # Nothing more will arrive for pending requests
+            self._closed = True
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result(
+                        ({"error": "No response from MCP server"}, None)
+                    )
+            self._pending.clear()
+            if self.on_close:
+                self.on_close(self)
+        
+    async def _drain_stderr(self):
+        """Forward server logs so a full stderr pipe never blocks Node."""
+        # Read in chunks rather than lines, which would fail on a line
+        # longer than the stream limit and leave the pipe unread
+        partial = b""
+        while True:
+            chunk = await self.process.stderr.read(64 * 1024)
+            if not chunk:
+                break
+            *lines, partial = (partial + chunk).split(b"\n")
+            if len(partial) >= 64 * 1024:
+                lines.append(partial)
+                partial = b""
+            for line in lines:
+                logger.info("node: %s", line.decode(errors="replace").rstrip())
+        if partial:
+            logger.info("node: %s", partial.decode(errors="replace").rstrip())
+            
+    async def _write_batches(self):
+        """Write queued messages to the MCP server, coalescing bursts."""
+        while True:
+            messages = [await self._outbox.get()]
+            await asyncio.sleep(self.batch_window)
+            while not self._outbox.empty():
+                messages.append(self._outbox.get_nowait())
+                
+            # One newline-delimited message each, but a single pipe write
+            try:
+                self.process.stdin.write(
+                    b"".join(part for _, raw in messages for part in (raw, b"\n"))
+                )
+                await self.process.stdin.drain()
+            except Exception as e:
+                logger.error("Error writing to MCP server: %s", e)
+                for request_id, _ in messages:
+                    if request_id is not None:
+                        self._resolve(request_id, ({"error": str(e)}, None))
+                    
+    def notify(self, raw: bytes):
+        """Queue an encoded notification, which gets no response."""
+        self._outbox.put_nowait((None, raw))
+        
+    async def request(self, request: Dict[str, Any], raw: bytes) -> bytes:
+        """Send a request and wait for its encoded response.
+        
+        The client's encoded request and the server's response line are
+        passed through untouched unless another in-flight request already
+        uses the same id, in which case the id is swapped for our own.
+        """
+        request_id = request["id"]
+        if request_id in self._pending:
+            # Clients may send ids that look like ours, so skip any in use
+            while request_id in self._pending:
+                request_id = f"bridge-{next(self._next_id)}"
+            raw = orjson.dumps({**request, "id": request_id})
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._outbox.put_nowait((request_id, raw))
+        
+        try:
+            response, response_line = await asyncio.wait_for(
+                future, timeout=self.request_timeout
+            )
+        except asyncio.TimeoutError:
+            response, response_line = {"error": "MCP server timed out"}, None
+        finally:
+            # Abandoned or timed-out requests must not linger as in flight
+            if self._pending.get(request_id) is future:
+                del self._pending[request_id]
+        if response_line is not None and request_id == request["id"]:
+            return response_line
+        return orjson.dumps({**response, "id": request["id"]})
+        
+    async def stop(self):
+        """Stop the MCP server process."""
+        if self.process:
+            if self.process.returncode is None:
+                self.process.terminate()
+            try:
+                await asyncio.wait_for(
+                    self.process.wait(), timeout=self.stop_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("MCP server did not exit in time, killing it")
+                self.process.kill()
+                await self.process.wait()
+            # A failed reader has already been logged; don't fail the stop
+            for task in (self._reader_task, self._stderr_task):
+                if task:
+                    await asyncio.gather(task, return_exceptions=True)
+            if self._writer_task:
+                self._writer_task.cancel()
+
+
 class MCPHTTPBridge:
-    """Bridge between HTTP transport and stdio MCP server."""
+    """Bridge between HTTP transport and a pool of stdio MCP servers."""
+    
+    # How long a server-initiated request waits for a client reply
+    server_request_timeout = 300.0
+    # Most server-initiated requests awaiting replies; the oldest go first
+    max_server_requests = 1024
     
-    def __init__(self, server_path: str):
+    def __init__(self, server_path: str, workers: int = 1):
         self.server_path = server_path
-        self.process: Optional[subprocess.Popen] = None
+        self.worker_count = workers
+        self.workers: List[MCPWorker] = []
         self.transport: Optional[HTTPTransport] = None
+        # Server-initiated requests awaiting a client reply, keyed by the
+        # id published to clients, with the worker and id that Node used
+        # and when the entry expires; kept in the order they were made
+        self._server_requests: Dict[Any, Tuple[MCPWorker, Any, float]] = {}
+        self._next_id = itertools.count(1)
         
     async def start_mcp_server(self):
-        """Start the Node.js MCP server process."""
+        """Start the Node.js MCP server processes."""
         try:
-            self.process = subprocess.Popen(
-                ["node", self.server_path],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
+            for _ in range(self.worker_count):
+                worker = MCPWorker(
+                    self.server_path, self._publish, self._forget_worker
+                )
+                self.workers.append(worker)
+                await worker.start()
+            logger.info(
+                "Started %d MCP server process(es): %s",
+                self.worker_count, self.server_path
             )
-            logger.info(f"Started MCP server process: {self.server_path}")
         except Exception as e:
-            logger.error(f"Failed to start MCP server: {e}")
+            logger.error("Failed to start MCP server: %s", e)
             raise
             
-    async def handle_mcp_request(
-        self, request: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """Handle MCP JSON-RPC request."""
-        if not self.process:
-            return {"error": "MCP server not started"}
+    def _publish(self, worker: MCPWorker, message: Dict[str, Any]):
+        """Forward server-initiated messages to SSE clients."""
+        if "method" in message and "id" in message:
+            # Workers number their requests independently, so publish an
+            # id that is unique across the pool
+            self._expire_server_requests(room=1)
+            server_id = request_id = message["id"]
+            while request_id in self._server_requests:
+                request_id = f"bridge-{next(self._next_id)}"
+            self._server_requests[request_id] = (
+                worker, server_id,
+                asyncio.get_running_loop().time() + self.server_request_timeout
+            )
+            if request_id != server_id:
+                message = {**message, "id": request_id}
+        if self.transport:
+            self.transport.publish(message)
             
-        try:
-            # Send request to MCP server
-            request_json = json.dumps(request) + "\\n"
-            self.process.stdin.write(request_json)
-            self.process.stdin.flush()
+    def _expire_server_requests(self, room: int = 0):
+        """Drop expired entries, and the oldest until room more fit."""
+        now = asyncio.get_running_loop().time()
+        requests = self._server_requests
+        # Entries expire in insertion order, so only the front needs checking
+        while requests and (
+            len(requests) + room > self.max_server_requests
+            or next(iter(requests.values()))[2] <= now
+        ):
+            del requests[next(iter(requests))]
             
-            # Read response
-            response_line = self.process.stdout.readline()
-            if response_line:
-                return json.loads(response_line.strip())
-            else:
-                return {"error": "No response from MCP server"}
-                
-        except Exception as e:
-            logger.error(f"Error handling MCP request: {e}")
-            return {"error": str(e)}
+    def _forget_worker(self, worker: MCPWorker):
+        """Drop requests from a server that can no longer take replies."""
+        self._server_requests = {
+            request_id: origin
+            for request_id, origin in self._server_requests.items()
+            if origin[0] is not worker
+        }
+            
+    def _answer_server_request(self, response: Dict[str, Any], raw: bytes):
+        """Send a client's reply to the worker whose request it answers."""
+        self._expire_server_requests()
+        origin = self._server_requests.pop(response.get("id"), None)
+        if (
+            origin is None or not origin[0].alive
+            or origin[2] <= asyncio.get_running_loop().time()
+        ):
+            return orjson.dumps({"error": "Unknown server request id"})
+        worker, server_id, _ = origin
+        if server_id != response["id"]:
+            raw = orjson.dumps({**response, "id": server_id})
+        worker.notify(raw)
+        return b"{}"
+            
+    async def handle_mcp_request(self, raw: bytes) -> bytes:
+        """Handle an encoded MCP JSON-RPC request."""
+        if not self.workers:
+            return orjson.dumps({"error": "MCP server not started"})
+        workers = [worker for worker in self.workers if worker.alive]
+        if not workers:
+            return orjson.dumps({"error": "No MCP server process is running"})
+            
+        # Parsed only for routing; the raw bytes are what gets forwarded,
+        # unless a pretty-printed body would break newline framing
+        request = orjson.loads(raw)
+        if not isinstance(request, dict):
+            # Batches would otherwise look like notifications below
+            message = "Invalid Request"
+            if isinstance(request, list):
+                message += ": batch requests are not supported"
+            return orjson.dumps({
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {"code": -32600, "message": message}
+            })
+        if b"\n" in raw or b"\r" in raw:
+            raw = orjson.dumps(request)
+            
+        # Replies to server-initiated requests need no response of their own
+        if "method" not in request:
+            return self._answer_server_request(request, raw)
+            
+        # Every worker must see the session handshake and notifications,
+        # otherwise requests routed to it would hit an uninitialized server
+        if "id" not in request:
+            for worker in workers:
+                worker.notify(raw)
+            return b"{}"
+        if request.get("method") == "initialize":
+            responses = await asyncio.gather(
+                *(worker.request(request, raw) for worker in workers)
+            )
+            return responses[0]
+            
+        worker = min(workers, key=lambda w: w.in_flight)
+        return await worker.request(request, raw)
             
-    async def start_http_transport(self, host: str, port: int):
+    async def start_http_transport(
+        self, host: str, port: int, fast_port: Optional[int] = None
+    ):
         """Start HTTP transport server."""
-        config = HTTPTransportConfig(host=host, port=port)
-        self.transport = HTTPTransport(config)
+        config = HTTPTransportConfig(host=host, port=port, fast_port=fast_port)
+        self.transport = HTTPTransport(config, self.handle_mcp_request)
+        self.transport.add_shutdown_handler(self.stop)
         
-        # Set the MCP handler
-        self.transport.set_mcp_handler(self.handle_mcp_request)
-        
-        logger.info(f"Starting HTTP transport on {host}:{port}")
+        logger.info("Starting HTTP transport on %s:%s", host, port)
         await self.transport.start()
         
-    async def start(self, host: str, port: int):
+    async def start(
+        self, host: str, port: int, fast_port: Optional[int] = None
+    ):
         """Start both MCP server and HTTP transport."""
         await self.start_mcp_server()
-        await self.start_http_transport(host, port)
+        await self.start_http_transport(host, port, fast_port)
         
-    def stop(self):
-        """Stop the MCP server process."""
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
-            logger.info("MCP server process stopped")
+    async def stop(self):
+        """Stop the MCP server processes."""
+        workers, self.workers = self.workers, []
+        if workers:
+            await asyncio.gather(*(worker.stop() for worker in workers))
+            logger.info("MCP server processes stopped")
+
 
+def create_app():
+    """Build a bridge app for one uvicorn worker process.
+    
+    Used by ``--http-workers``; settings come from the environment since
+    each worker imports and calls this on its own.
+    """
+    bridge = MCPHTTPBridge(
+        os.environ.get("MCP_SERVER_PATH", "../build/index.js"),
+        int(os.environ.get("MCP_WORKERS", "1"))
+    )
+    bridge.transport = HTTPTransport(
+        HTTPTransportConfig(), bridge.handle_mcp_request
+    )
+    bridge.transport.add_startup_handler(bridge.start_mcp_server)
+    bridge.transport.add_shutdown_handler(bridge.stop)
+    return bridge.transport.app
 
-async def main():
+
+async def serve(args: argparse.Namespace):
+    """Run the bridge in this process."""
+    bridge = MCPHTTPBridge(args.server, args.mcp_workers)
+    
+    try:
+        await bridge.start(args.host, args.port, args.fast_port)
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        await bridge.stop()
+
+
+def main():
     parser = argparse.ArgumentParser(description="MCP HTTP Bridge")
     parser.add_argument("--host", default="0.0.0.0", help="HTTP host")
     parser.add_argument("--port", type=int, default=8080, help="HTTP port")
     parser.add_argument("--server", default="../build/index.js",
                         help="Path to MCP server")
+    parser.add_argument("--mcp-workers", type=int, default=1,
+                        help="Number of MCP server processes per HTTP worker")
+    parser.add_argument("--http-workers", type=int, default=1,
+                        help="Number of HTTP worker processes")
+    parser.add_argument("--fast-port", type=int, default=None,
+                        help="Extra port serving only POST /mcp")
     
     args = parser.parse_args()
     
-    bridge = MCPHTTPBridge(args.server)
-    
+    if args.http_workers > 1:
+        # Each worker builds its own bridge through create_app()
+        os.environ["MCP_SERVER_PATH"] = os.path.abspath(args.server)
+        os.environ["MCP_WORKERS"] = str(args.mcp_workers)
+        config = HTTPTransportConfig(
+            host=args.host,
+            port=args.port,
+            workers=args.http_workers,
+            app_factory="http_server:create_app",
+            app_dir=os.path.dirname(os.path.abspath(__file__)),
+            fast_port=args.fast_port
+        )
+        HTTPTransport(config).run()
+        return
+        
+    # start() serves inside an already running loop, so uvicorn's loop
+    # setting cannot apply; pick uvloop here instead when it is installed
     try:
-        await bridge.start(args.host, args.port)
-    except KeyboardInterrupt:
-        logger.info("Shutting down...")
-    finally:
-        bridge.stop()
+        import uvloop
+    except ImportError:
+        uvloop = None
+    (uvloop.run if uvloop else asyncio.run)(serve(args))
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -3,84 +3,395 @@ HTTP Transport for MCP Server
 Implements HTTP/SSE streaming alongside stdio transport
 """
 import asyncio
-import json
+import contextlib
 import logging
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict, Any, Set, List
 from dataclasses import dataclass
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
-from fastapi.middleware.cors import CORSMiddleware
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+import orjson
 import uvicorn
 
+# Prefer the C-accelerated event loop and HTTP parser when installed
+# (uvloop is not available on Windows)
+try:
+    import uvloop
+    UVICORN_LOOP = "uvloop"
+except ImportError:
+    UVICORN_LOOP = "asyncio"
+try:
+    import httptools
+    UVICORN_HTTP = "httptools"
+except ImportError:
+    httptools = None
+    UVICORN_HTTP = "h11"
+
 logger = logging.getLogger(__name__)
 
+# SSE comment line sent to idle clients; EventSource ignores it
+SSE_KEEPALIVE = b": keepalive\n\n"
+
+# Bodies in this size range are read into a preallocated buffer
+LARGE_BODY_MIN = 64 * 1024
+LARGE_BODY_MAX = 16 * 1024 * 1024
+
+
+async def _read_body(request: Request):
+    """Read a request body without joining chunks for large payloads."""
+    length = request.headers.get("content-length", "")
+    if not length.isdigit():
+        # Chunked bodies have no declared size, so cap them as they arrive
+        chunks = []
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > LARGE_BODY_MAX:
+                raise HTTPException(413, "Request body too large")
+            chunks.append(chunk)
+        return b"".join(chunks)
+    size = int(length)
+    if size > LARGE_BODY_MAX:
+        raise HTTPException(413, "Request body too large")
+    if size < LARGE_BODY_MIN:
+        return await request.body()
+        
+    buffer = bytearray(size)
+    offset = 0
+    async for chunk in request.stream():
+        end = offset + len(chunk)
+        if end > len(buffer):
+            raise ValueError("Request body exceeds Content-Length")
+        buffer[offset:end] = chunk
+        offset = end
+    del buffer[offset:]
+    return buffer
+
+
+class JSONRPCProtocol(asyncio.Protocol):
+    """Bare HTTP/1.1 server for POST /mcp, parsed in C by httptools.
+    
+    Skips the ASGI stack entirely: the request body goes straight to the
+    MCP handler and its encoded reply is written back to the socket.
+    """
+    
+    # Largest request body accepted, whether declared or streamed
+    max_body = LARGE_BODY_MAX
+    # Unanswered requests per connection before reading is paused
+    max_pipelined = 16
+    # Seconds a connection may sit with nothing in flight before closing
+    idle_timeout = 5.0
+    
+    def __init__(self, handler: Callable):
+        self.handler = handler
+        self.parser = httptools.HttpRequestParser(self)
+        self.transport: Optional[asyncio.Transport] = None
+        self._url = b""
+        self._body: List[bytes] = []
+        self._size = 0
+        # Last response in flight, so pipelined replies keep their order
+        self._previous: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self._paused = False
+        # Set once a final error reply is queued; later input is ignored
+        self._rejected = False
+        self._idle: Optional[asyncio.TimerHandle] = None
+        
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        self._start_idle_timer()
+        
+    def connection_lost(self, exc: Optional[Exception]):
+        if self._idle:
+            self._idle.cancel()
+            
+    def _start_idle_timer(self):
+        if self._idle:
+            self._idle.cancel()
+        self._idle = asyncio.get_running_loop().call_later(
+            self.idle_timeout, self.transport.close
+        )
+        
+    def data_received(self, data: bytes):
+        if self._idle:
+            self._idle.cancel()
+            self._idle = None
+        if self._rejected:
+            return
+        try:
+            self.parser.feed_data(data)
+        except (httptools.HttpParserError, httptools.HttpParserUpgrade):
+            self._reject(b"400 Bad Request", b'{"error":"Bad request"}')
+        if not self._in_flight and not self._rejected:
+            self._start_idle_timer()
+            
+    def on_message_begin(self):
+        self._url = b""
+        self._body = []
+        self._size = 0
+        
+    def on_url(self, url: bytes):
+        self._url += url
+        
+    def on_header(self, name: bytes, value: bytes):
+        name = name.lower()
+        if name == b"content-length":
+            if value.isdigit() and int(value) > self.max_body:
+                self._reject_too_large()
+        elif name == b"expect" and value.lower() == b"100-continue":
+            if self._rejected:
+                return
+            if self._in_flight:
+                # Earlier pipelined replies have to go out first
+                self._previous = asyncio.ensure_future(
+                    self._continue(self._previous)
+                )
+            else:
+                self.transport.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            
+    def on_body(self, body: bytes):
+        if self._rejected:
+            return
+        self._size += len(body)
+        if self._size > self.max_body:
+            self._reject_too_large()
+            return
+        self._body.append(body)
+        
+    def on_message_complete(self):
+        if self._rejected:
+            return
+        keep_alive = self.parser.should_keep_alive()
+        if self._url.split(b"?", 1)[0] != b"/mcp":
+            self._send(b"404 Not Found", b'{"error":"Not found"}', keep_alive)
+        elif self.parser.get_method() != b"POST":
+            self._send(
+                b"405 Method Not Allowed", b'{"error":"Method not allowed"}',
+                keep_alive
+            )
+        elif self._in_flight >= self.max_pipelined:
+            # Only reachable when one read held more requests than the cap
+            self._reject(
+                b"503 Service Unavailable",
+                b'{"error":"Too many pipelined requests"}'
+            )
+        else:
+            self._send(None, b"".join(self._body), keep_alive)
+            
+    async def _continue(self, previous: asyncio.Task):
+        """Send the interim 100 Continue after earlier replies."""
+        await previous
+        if not self.transport.is_closing():
+            self.transport.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            
+    def _reject_too_large(self):
+        self._reject(
+            b"413 Payload Too Large", b'{"error":"Request body too large"}'
+        )
+        
+    def _reject(self, status: bytes, body: bytes):
+        """Queue a final error reply, then close the connection."""
+        if self._rejected:
+            return
+        self._rejected = True
+        self._send(status, body, False)
+        
+    def _send(self, status: Optional[bytes], body: bytes, keep_alive: bool):
+        """Queue a reply behind earlier ones; a None status runs the handler."""
+        self._in_flight += 1
+        if self._in_flight >= self.max_pipelined and not self._paused:
+            self._paused = True
+            self.transport.pause_reading()
+        self._previous = asyncio.ensure_future(
+            self._dispatch(status, body, keep_alive, self._previous)
+        )
+        
+    async def _dispatch(
+        self, status: Optional[bytes], body: bytes, keep_alive: bool,
+        previous: Optional[asyncio.Task]
+    ):
+        """Run the MCP handler if needed and write its reply in order."""
+        try:
+            if status is None:
+                status = b"200 OK"
+                try:
+                    body = await self.handler(body)
+                except Exception as e:
+                    logger.error("Error handling JSON-RPC request: %s", e)
+                    body = orjson.dumps({"error": str(e)})
+            if previous:
+                await previous
+            self._respond(status, body, keep_alive)
+        finally:
+            self._in_flight -= 1
+            if self.transport.is_closing() or self._rejected:
+                return
+            if self._paused and self._in_flight < self.max_pipelined:
+                self._paused = False
+                self.transport.resume_reading()
+            if not self._in_flight:
+                self._start_idle_timer()
+        
+    def _respond(self, status: bytes, body: bytes, keep_alive: bool):
+        """Write a complete JSON response."""
+        if self.transport.is_closing():
+            return
+        self.transport.write(
+            b"HTTP/1.1 %s\r\n"
+            b"Content-Type: application/json\r\n"
+            b"Content-Length: %d\r\n"
+            b"%s\r\n" % (
+                status,
+                len(body),
+                b"" if keep_alive else b"Connection: close\r\n"
+            ) + body
+        )
+        if not keep_alive:
+            self.transport.close()
+
+
+class _Server(uvicorn.Server):
+    """uvicorn server that runs a callback as soon as shutdown begins."""
+    
+    def __init__(self, config: uvicorn.Config, on_shutdown: Callable):
+        super().__init__(config)
+        self.on_shutdown = on_shutdown
+        
+    async def shutdown(self, sockets=None):
+        # uvicorn waits for open connections before the lifespan shutdown,
+        # so long-lived streams have to be told to finish first
+        self.on_shutdown()
+        await super().shutdown(sockets)
+
 
 @dataclass
 class HTTPTransportConfig:
     """Configuration for HTTP transport."""
     host: str = "0.0.0.0"
     port: int = 8080
+    # An empty list disables CORS handling altogether
     cors_origins: Optional[list] = None
+    cors_allow_credentials: bool = False
+    # Worker processes for run(). More than one needs app_factory, the
+    # import string of a function building the app (e.g. "module:create_app")
+    # that each worker calls, and app_dir if that module is not importable
+    workers: int = 1
+    app_factory: Optional[str] = None
+    app_dir: Optional[str] = None
+    # Optional second port serving only POST /mcp via JSONRPCProtocol
+    fast_port: Optional[int] = None
+    # Seconds to wait for open connections (e.g. SSE streams) on shutdown
+    # before closing them, so shutdown handlers always get to run
+    shutdown_timeout: int = 5
     
     def __post_init__(self):
         if self.cors_origins is None:
             self.cors_origins = ["*"]
+        if self.cors_allow_credentials and "*" in self.cors_origins:
+            raise ValueError(
+                "cors_allow_credentials needs explicit cors_origins, not '*'"
+            )
+        if self.workers < 1:
+            raise ValueError("workers must be at least 1")
+        if self.workers > 1 and not self.app_factory:
+            raise ValueError("app_factory is required when workers > 1")
+        if self.workers > 1 and self.fast_port is not None:
+            raise ValueError("fast_port is not supported when workers > 1")
 
 
 class HTTPTransport:
     """HTTP transport implementation for MCP server."""
     
-    def __init__(self, config: HTTPTransportConfig):
+    def __init__(
+        self,
+        config: HTTPTransportConfig,
+        mcp_handler: Optional[Callable] = None
+    ):
         self.config = config
-        self.app = FastAPI(title="MCP Server HTTP Transport")
+        self.app = Starlette(lifespan=self._lifespan)
         self.mcp_handler: Optional[Callable] = None
+        self._startup_handlers: List[Callable] = []
+        self._shutdown_handlers: List[Callable] = []
+        # One bounded queue per connected SSE client
+        self._sse_clients: Set[asyncio.Queue] = set()
         self._setup_middleware()
         self._setup_routes()
+        if mcp_handler:
+            self.set_mcp_handler(mcp_handler)
         
+    @contextlib.asynccontextmanager
+    async def _lifespan(self, app: Starlette):
+        """Run startup and shutdown handlers around serving."""
+        for handler in self._startup_handlers:
+            await handler()
+        yield
+        for handler in self._shutdown_handlers:
+            await handler()
+            
     def _setup_middleware(self):
         """Set up CORS and other middleware."""
-        origins = self.config.cors_origins or ["*"]
+        if not self.config.cors_origins:
+            return
         self.app.add_middleware(
             CORSMiddleware,
-            allow_origins=origins,
-            allow_credentials=True,
+            allow_origins=self.config.cors_origins,
+            allow_credentials=self.config.cors_allow_credentials,
             allow_methods=["GET", "POST", "OPTIONS"],
             allow_headers=["*"],
         )
         
-    def _setup_routes(self):
-        """Set up HTTP routes for MCP protocol."""
+    def _setup_mcp_route(self, handler: Callable):
+        """Bind the JSON-RPC route to the MCP handler."""
+        # Replace any route bound to a previous handler
+        self.app.router.routes[:] = [
+            route for route in self.app.router.routes
+            if getattr(route, "path", None) != "/mcp"
+        ]
         
-        @self.app.post("/mcp")
         async def handle_jsonrpc(request: Request):
             """Handle JSON-RPC requests over HTTP."""
+            # The handler takes and returns encoded JSON-RPC messages
             try:
-                body = await request.json()
-                if self.mcp_handler:
-                    result = await self.mcp_handler(body)
-                    return result
-                else:
-                    return {"error": "MCP handler not configured"}
+                result = await handler(await _read_body(request))
+            except HTTPException as e:
+                return Response(
+                    orjson.dumps({"error": e.detail}), status_code=e.status_code,
+                    media_type="application/json"
+                )
             except Exception as e:
-                logger.error(f"Error handling JSON-RPC request: {e}")
-                return {"error": str(e)}
-                
-        @self.app.get("/mcp/stream")
+                logger.error("Error handling JSON-RPC request: %s", e)
+                result = orjson.dumps({"error": str(e)})
+            return Response(result, media_type="application/json")
+            
+        self.app.router.routes.append(
+            Route("/mcp", handle_jsonrpc, methods=["POST"])
+        )
+            
+    def _setup_routes(self):
+        """Set up HTTP routes for MCP protocol."""
+        
         async def handle_sse_stream(request: Request):
             """Handle Server-Sent Events streaming."""
             async def event_stream():
+                queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+                self._sse_clients.add(queue)
                 try:
                     while True:
-                        # Implement SSE streaming logic
-                        timestamp = asyncio.get_event_loop().time()
-                        data = json.dumps({
-                            "type": "heartbeat",
-                            "timestamp": timestamp
-                        })
-                        yield f"data: {data}\n\n"
-                        await asyncio.sleep(30)  # Heartbeat every 30 seconds
+                        # Forward events as they arrive; keep alive when idle
+                        try:
+                            data = await asyncio.wait_for(queue.get(), timeout=15)
+                        except asyncio.TimeoutError:
+                            data = SSE_KEEPALIVE
+                        if data is None:
+                            return
+                        yield data
                 except asyncio.CancelledError:
                     return
+                finally:
+                    self._sse_clients.discard(queue)
                     
             return StreamingResponse(
                 event_stream(),
@@ -88,33 +399,120 @@ class HTTPTransport:
                 headers={
                     "Cache-Control": "no-cache",
                     "Connection": "keep-alive",
+                    "X-Accel-Buffering": "no",
                 }
             )
             
-        @self.app.get("/health")
-        async def health_check():
+        async def health_check(request: Request):
             """Health check endpoint."""
-            return {"status": "healthy", "transport": "http"}
+            return JSONResponse({"status": "healthy", "transport": "http"})
+            
+        self.app.router.routes.extend([
+            Route("/mcp/stream", handle_sse_stream, methods=["GET"]),
+            Route("/health", health_check, methods=["GET"]),
+        ])
             
     def set_mcp_handler(self, handler: Callable):
         """Set the MCP message handler."""
         self.mcp_handler = handler
+        self._setup_mcp_route(handler)
+        
+    def add_startup_handler(self, handler: Callable):
+        """Register a coroutine function to await on server startup."""
+        self._startup_handlers.append(handler)
+        
+    def add_shutdown_handler(self, handler: Callable):
+        """Register a coroutine function to await on server shutdown."""
+        self._shutdown_handlers.append(handler)
         
+    def _check_mcp_handler(self):
+        """Refuse to serve /mcp without a handler."""
+        if not self.mcp_handler:
+            raise RuntimeError("MCP handler not configured")
+        
+    def publish(self, message: Dict[str, Any]):
+        """Push a server message to every connected SSE client."""
+        # Encode once; Starlette passes bytes chunks through untouched
+        data = b"data: " + orjson.dumps(message) + b"\n\n"
+        for queue in self._sse_clients:
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                logger.warning("Dropping SSE event for slow client")
+        
+    def close_streams(self):
+        """End every open SSE stream, e.g. so the server can shut down."""
+        for queue in self._sse_clients:
+            # Make room for the end-of-stream marker if the queue is full
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+            
     async def start(self):
-        """Start the HTTP server."""
+        """Start the HTTP server.
+        
+        Serves this app instance in the current process; use run() for
+        multiple workers.
+        """
+        if self.config.workers > 1:
+            raise RuntimeError("start() serves a single process; use run()")
+        self._check_mcp_handler()
+        fast_server = None
+        if self.config.fast_port is not None:
+            if httptools is None:
+                raise RuntimeError("fast_port requires httptools")
+            fast_server = await asyncio.get_running_loop().create_server(
+                lambda: JSONRPCProtocol(self.mcp_handler),
+                self.config.host,
+                self.config.fast_port
+            )
+            logger.info("Serving POST /mcp on port %d", self.config.fast_port)
         config = uvicorn.Config(
             self.app,
             host=self.config.host,
             port=self.config.port,
-            log_level="info"
+            log_level="info",
+            loop=UVICORN_LOOP,
+            http=UVICORN_HTTP,
+            access_log=False,
+            timeout_graceful_shutdown=self.config.shutdown_timeout
         )
-        server = uvicorn.Server(config)
-        await server.serve()
+        server = _Server(config, self.close_streams)
+        try:
+            await server.serve()
+        finally:
+            if fast_server:
+                fast_server.close()
+                await fast_server.wait_closed()
         
     def run(self):
-        """Run the HTTP server (blocking)."""
-        uvicorn.run(
-            self.app,
-            host=self.config.host,
-            port=self.config.port
-        )
\ No newline at end of file
+        """Run the HTTP server (blocking).
+        
+        With more than one worker, each worker builds its own app from
+        config.app_factory; this instance's app and handlers are not used.
+        """
+        # uvicorn can only fork workers for an app it can import itself
+        if self.config.workers > 1:
+            uvicorn.run(
+                self.config.app_factory,
+                factory=True,
+                app_dir=self.config.app_dir,
+                host=self.config.host,
+                port=self.config.port,
+                workers=self.config.workers,
+                loop=UVICORN_LOOP,
+                http=UVICORN_HTTP,
+                access_log=False,
+                timeout_graceful_shutdown=self.config.shutdown_timeout
+            )
+            return
+            
+        # start() also serves the fast port; it runs inside a loop, so
+        # pick uvloop here since uvicorn's loop setting cannot apply
+        self._check_mcp_handler()
+        # uvicorn re-raises the signal that stopped it once it has shut down
+        with contextlib.suppress(KeyboardInterrupt):
+            if UVICORN_LOOP == "uvloop":
+                uvloop.run(self.start())
+            else:
+                asyncio.run(self.start())
\ No newline at end of file
@@ -0,0 +1,54 @@
+// Minimal stdio JSON-RPC server used by the bridge tests.
+// Echoes request params back as the result, after params.delay ms if given.
+// Requests for the "emit" method also send a notification first, and the
+// "exit" method stops the server without replying. The "ask" method sends a
+// request to the client and replies with the result the client answers.
+// The "junk" method writes a bare JSON number before its reply, and the
+// "shout" method writes a very long line and then "done" to stderr.
+import { createInterface } from "node:readline";
+
+const rl = createInterface({ input: process.stdin });
+const asks = new Map();
+
+rl.on("line", (line) => {
+  const request = JSON.parse(line);
+  if (request.method === undefined) {
+    const id = asks.get(request.id);
+    asks.delete(request.id);
+    process.stdout.write(
+      JSON.stringify({ jsonrpc: "2.0", id, result: request.result }) + "\n"
+    );
+    return;
+  }
+  if (request.id === undefined) {
+    return;
+  }
+  if (request.method === "exit") {
+    process.exit(0);
+  }
+  const params = request.params || {};
+  if (request.method === "ask") {
+    const askId = `ask-${request.id}`;
+    asks.set(askId, request.id);
+    process.stdout.write(
+      JSON.stringify({ jsonrpc: "2.0", id: askId, method: "sampling/createMessage", params }) + "\n"
+    );
+    return;
+  }
+  if (request.method === "junk") {
+    process.stdout.write("42\n");
+  }
+  if (request.method === "shout") {
+    process.stderr.write("x".repeat(200 * 1024) + "\ndone\n");
+  }
+  if (request.method === "emit") {
+    process.stdout.write(
+      JSON.stringify({ jsonrpc: "2.0", method: "notifications/message", params }) + "\n"
+    );
+  }
+  setTimeout(() => {
+    process.stdout.write(
+      JSON.stringify({ jsonrpc: "2.0", id: request.id, result: params }) + "\n"
+    );
+  }, params.delay || 0);
+});
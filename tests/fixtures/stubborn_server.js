@@ -0,0 +1,3 @@
+// Stdio server that ignores SIGTERM, used to test forced shutdown.
+process.on("SIGTERM", () => {});
+setInterval(() => {}, 1000);
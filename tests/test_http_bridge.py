@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the HTTP-to-stdio MCP bridge.
+Runs the bridge against a small Node.js echo server.
+"""
+import asyncio
+import shutil
+import sys
+import unittest
+import unittest.mock
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+
+import orjson  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+from http_server import MCPHTTPBridge, MCPWorker, create_app  # noqa: E402
+
+ECHO_SERVER = PROJECT_ROOT / "tests" / "fixtures" / "echo_server.js"
+STUBBORN_SERVER = PROJECT_ROOT / "tests" / "fixtures" / "stubborn_server.js"
+
+
+async def call(bridge, message):
+    """Send a JSON-RPC message through the bridge and decode the reply."""
+    return orjson.loads(await bridge.handle_mcp_request(orjson.dumps(message)))
+
+
+@unittest.skipIf(shutil.which("node") is None, "node is not installed")
+class TestMCPHTTPBridge(unittest.IsolatedAsyncioTestCase):
+    """Test request routing between HTTP handlers and the MCP process."""
+
+    async def asyncSetUp(self):
+        """Start the bridge against the echo server."""
+        self.bridge = MCPHTTPBridge(str(ECHO_SERVER))
+        await self.bridge.start_mcp_server()
+
+    async def asyncTearDown(self):
+        """Stop the echo server."""
+        await self.bridge.stop()
+
+    async def test_single_request(self):
+        """Test a request gets its response with the caller's id."""
+        response = await call(self.bridge, {
+            "jsonrpc": "2.0", "id": "abc", "method": "echo",
+            "params": {"value": 1}
+        })
+        self.assertEqual(response["id"], "abc")
+        self.assertEqual(response["result"], {"value": 1})
+
+    async def test_large_response(self):
+        """Test a response line longer than asyncio's default limit."""
+        value = "x" * (200 * 1024)
+        response = await asyncio.wait_for(call(self.bridge, {
+            "jsonrpc": "2.0", "id": 1, "method": "echo",
+            "params": {"value": value}
+        }), timeout=5)
+        self.assertEqual(response["result"], {"value": value})
+
+    async def test_non_object_output_is_ignored(self):
+        """Test stray JSON values from the server don't stop the reader."""
+        response = await call(self.bridge, {
+            "jsonrpc": "2.0", "id": 1, "method": "junk"
+        })
+        self.assertEqual(response["result"], {})
+        self.assertTrue(self.bridge.workers[0].alive)
+
+    async def test_read_errors_retire_the_worker(self):
+        """Test a failed reader fails pending requests and stops cleanly."""
+        bridge = MCPHTTPBridge(str(ECHO_SERVER))
+        with unittest.mock.patch.object(MCPWorker, "max_line", 1024):
+            await bridge.start_mcp_server()
+        try:
+            response = await asyncio.wait_for(call(bridge, {
+                "jsonrpc": "2.0", "id": 1, "method": "echo",
+                "params": {"value": "x" * 2048}
+            }), timeout=5)
+            self.assertEqual(
+                response, {"error": "No response from MCP server", "id": 1}
+            )
+            self.assertFalse(bridge.workers[0].alive)
+        finally:
+            await asyncio.wait_for(bridge.stop(), timeout=5)
+
+    async def test_long_stderr_lines_are_drained(self):
+        """Test a stderr line over the stream limit does not stop logs."""
+        bridge = MCPHTTPBridge(str(ECHO_SERVER))
+        with unittest.mock.patch.object(MCPWorker, "max_line", 1024):
+            await bridge.start_mcp_server()
+        try:
+            with self.assertLogs("http_server", "INFO") as logs:
+                await call(bridge, {
+                    "jsonrpc": "2.0", "id": 1, "method": "shout"
+                })
+                for _ in range(100):
+                    if "INFO:http_server:node: done" in logs.output:
+                        break
+                    await asyncio.sleep(0.01)
+            self.assertIn("INFO:http_server:node: done", logs.output)
+            self.assertFalse(bridge.workers[0]._stderr_task.done())
+        finally:
+            await bridge.stop()
+
+    async def test_concurrent_requests_are_not_swapped(self):
+        """Test out-of-order responses are routed to the right caller."""
+        requests = [
+            {"jsonrpc": "2.0", "id": 1, "method": "echo",
+             "params": {"value": i, "delay": (5 - i) * 20}}
+            for i in range(5)
+        ]
+        responses = await asyncio.gather(
+            *(call(self.bridge, r) for r in requests)
+        )
+        for i, response in enumerate(responses):
+            self.assertEqual(response["id"], 1)
+            self.assertEqual(response["result"]["value"], i)
+
+    async def test_notification_returns_immediately(self):
+        """Test notifications do not wait for a response."""
+        response = await asyncio.wait_for(
+            call(self.bridge, {
+                "jsonrpc": "2.0", "method": "notifications/initialized"
+            }),
+            timeout=1
+        )
+        self.assertEqual(response, {})
+
+    async def test_rewritten_ids_skip_client_ids(self):
+        """Test a swapped-in id never collides with a client's own id."""
+        requests = [
+            {"jsonrpc": "2.0", "id": request_id, "method": "echo",
+             "params": {"value": i, "delay": 50}}
+            for i, request_id in enumerate(["bridge-1", 1, 1])
+        ]
+        responses = await asyncio.wait_for(
+            asyncio.gather(*(call(self.bridge, r) for r in requests)),
+            timeout=2
+        )
+        self.assertEqual(
+            [(r["id"], r["result"]["value"]) for r in responses],
+            [("bridge-1", 0), (1, 1), (1, 2)]
+        )
+
+    async def test_abandoned_requests_are_not_in_flight(self):
+        """Test timed-out and cancelled requests leave no pending entry."""
+        published = []
+        self.bridge.transport = unittest.mock.Mock(publish=published.append)
+        worker = self.bridge.workers[0]
+        worker.request_timeout = 0.05
+        response = await call(self.bridge, {
+            "jsonrpc": "2.0", "id": 1, "method": "echo",
+            "params": {"delay": 100}
+        })
+        self.assertEqual(response, {"error": "MCP server timed out", "id": 1})
+        self.assertEqual(worker.in_flight, 0)
+        # The late response is dropped rather than broadcast
+        await asyncio.sleep(0.15)
+        self.assertEqual(published, [])
+
+        worker.request_timeout = 300.0
+        task = asyncio.ensure_future(call(self.bridge, {
+            "jsonrpc": "2.0", "id": 2, "method": "echo",
+            "params": {"delay": 500}
+        }))
+        await asyncio.sleep(0.05)
+        self.assertEqual(worker.in_flight, 1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(worker.in_flight, 0)
+
+    async def test_non_object_requests_are_rejected(self):
+        """Test batches and bare values get an Invalid Request error."""
+        published = []
+        self.bridge.transport = unittest.mock.Mock(publish=published.append)
+        for message in (
+            [{"jsonrpc": "2.0", "id": 1, "method": "echo"}], "hello"
+        ):
+            response = await call(self.bridge, message)
+            self.assertEqual(response["error"]["code"], -32600)
+            self.assertIsNone(response["id"])
+        await asyncio.sleep(0.05)
+        self.assertEqual(published, [])
+        self.assertEqual(self.bridge.workers[0].in_flight, 0)
+
+    async def test_request_bytes_are_forwarded(self):
+        """Test unique ids pass through and multi-line bodies are reframed."""
+        raw = b'{\n  "jsonrpc": "2.0",\n  "id": 3,\n  "method": "echo"\n}'
+        response = orjson.loads(await self.bridge.handle_mcp_request(raw))
+        self.assertEqual(response, {"jsonrpc": "2.0", "id": 3, "result": {}})
+
+    async def test_server_notifications_are_published(self):
+        """Test server-initiated messages are forwarded to the transport."""
+        published = []
+        self.bridge.transport = unittest.mock.Mock(publish=published.append)
+        await call(self.bridge, {
+            "jsonrpc": "2.0", "id": 7, "method": "emit",
+            "params": {"level": "info"}
+        })
+        self.assertEqual(published, [{
+            "jsonrpc": "2.0", "method": "notifications/message",
+            "params": {"level": "info"}
+        }])
+
+    async def test_worker_pool_spreads_requests(self):
+        """Test requests are spread across a pool of MCP processes."""
+        bridge = MCPHTTPBridge(str(ECHO_SERVER), workers=3)
+        await bridge.start_mcp_server()
+        try:
+            requests = [
+                {"jsonrpc": "2.0", "id": i, "method": "echo",
+                 "params": {"value": i, "delay": 50}}
+                for i in range(6)
+            ]
+            pending = asyncio.gather(
+                *(call(bridge, r) for r in requests)
+            )
+            await asyncio.sleep(0)
+            self.assertEqual(
+                [worker.in_flight for worker in bridge.workers], [2, 2, 2]
+            )
+            for i, response in enumerate(await pending):
+                self.assertEqual(response["id"], i)
+                self.assertEqual(response["result"]["value"], i)
+        finally:
+            await bridge.stop()
+
+    async def test_dead_workers_are_skipped(self):
+        """Test requests avoid a worker whose server has exited."""
+        bridge = MCPHTTPBridge(str(ECHO_SERVER), workers=2)
+        await bridge.start_mcp_server()
+        try:
+            response = await call(bridge, {
+                "jsonrpc": "2.0", "id": 0, "method": "exit"
+            })
+            self.assertIn("error", response)
+            self.assertEqual(
+                [worker.alive for worker in bridge.workers], [False, True]
+            )
+            for i in range(4):
+                response = await call(bridge, {
+                    "jsonrpc": "2.0", "id": i, "method": "echo",
+                    "params": {"value": i}
+                })
+                self.assertEqual(response["result"], {"value": i})
+
+            await call(bridge, {"jsonrpc": "2.0", "id": 9, "method": "exit"})
+            response = await call(bridge, {
+                "jsonrpc": "2.0", "id": 10, "method": "echo"
+            })
+            self.assertEqual(
+                response, {"error": "No MCP server process is running"}
+            )
+        finally:
+            await bridge.stop()
+
+    async def test_server_requests_are_answered_by_the_asking_worker(self):
+        """Test client replies reach the worker whose request they answer."""
+        bridge = MCPHTTPBridge(str(ECHO_SERVER), workers=2)
+        published = []
+        bridge.transport = unittest.mock.Mock(publish=published.append)
+        await bridge.start_mcp_server()
+        try:
+            # Both workers ask with the same id, so one must be renamed
+            asks = [
+                asyncio.ensure_future(call(bridge, {
+                    "jsonrpc": "2.0", "id": 5, "method": "ask"
+                }))
+                for _ in range(2)
+            ]
+            for _ in range(100):
+                if len(published) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            ids = [message["id"] for message in published]
+            self.assertEqual(len(set(ids)), 2)
+
+            for answer, request_id in enumerate(ids):
+                response = await call(bridge, {
+                    "jsonrpc": "2.0", "id": request_id,
+                    "result": {"answer": answer}
+                })
+                self.assertEqual(response, {})
+            responses = await asyncio.wait_for(asyncio.gather(*asks), 2)
+            self.assertEqual(
+                sorted(r["result"]["answer"] for r in responses), [0, 1]
+            )
+            self.assertEqual(
+                [worker.in_flight for worker in bridge.workers], [0, 0]
+            )
+
+            response = await call(bridge, {
+                "jsonrpc": "2.0", "id": ids[0], "result": {}
+            })
+            self.assertEqual(response, {"error": "Unknown server request id"})
+        finally:
+            await bridge.stop()
+
+    async def test_unanswered_server_requests_are_dropped(self):
+        """Test server requests expire, are capped and die with the worker."""
+        published = []
+        self.bridge.transport = unittest.mock.Mock(publish=published.append)
+        self.bridge.max_server_requests = 2
+
+        async def ask(request_id):
+            task = asyncio.ensure_future(call(self.bridge, {
+                "jsonrpc": "2.0", "id": request_id, "method": "ask"
+            }))
+            count = len(published)
+            while len(published) == count:
+                await asyncio.sleep(0.01)
+            return task
+
+        self.bridge.server_request_timeout = 0
+        asks = [await ask(0)]
+        await asyncio.sleep(0.01)
+        response = await call(self.bridge, {
+            "jsonrpc": "2.0", "id": "ask-0", "result": {}
+        })
+        self.assertEqual(response, {"error": "Unknown server request id"})
+
+        self.bridge.server_request_timeout = 300.0
+        asks += [await ask(i) for i in range(1, 4)]
+        self.assertEqual(list(self.bridge._server_requests), ["ask-2", "ask-3"])
+        await call(self.bridge, {"jsonrpc": "2.0", "id": 5, "method": "exit"})
+        self.assertEqual(self.bridge._server_requests, {})
+        await asyncio.gather(*asks)
+
+    async def test_stop_kills_unresponsive_server(self):
+        """Test stop() kills a server that ignores SIGTERM."""
+        bridge = MCPHTTPBridge(str(STUBBORN_SERVER))
+        await bridge.start_mcp_server()
+        worker = bridge.workers[0]
+        worker.stop_timeout = 0.2
+        # Let Node install its SIGTERM handler first
+        await asyncio.sleep(0.5)
+        await asyncio.wait_for(bridge.stop(), timeout=5)
+        self.assertEqual(worker.process.returncode, -9)
+        self.assertEqual(bridge.workers, [])
+
+
+@unittest.skipIf(shutil.which("node") is None, "node is not installed")
+class TestCreateApp(unittest.TestCase):
+    """Test the app factory used by HTTP worker processes."""
+
+    def test_app_starts_bridge_from_environment(self):
+        """Test the app starts MCP servers from the environment on startup."""
+        environ = {"MCP_SERVER_PATH": str(ECHO_SERVER), "MCP_WORKERS": "2"}
+        with unittest.mock.patch.dict("os.environ", environ):
+            app = create_app()
+        with TestClient(app) as client:
+            response = client.post("/mcp", content=orjson.dumps({
+                "jsonrpc": "2.0", "id": 1, "method": "echo",
+                "params": {"value": 1}
+            }))
+            self.assertEqual(response.json()["result"], {"value": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
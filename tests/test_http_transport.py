@@ -3,12 +3,33 @@
 Unit tests for HTTP transport functionality.
 Following TDD approach - testing the official MCP SDK implementation.
 """
+import asyncio
+import contextlib
 import json
 import os
+import socket
 import sys
 import unittest
+import unittest.mock
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from starlette.exceptions import HTTPException  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+from http_transport import (  # noqa: E402
+    LARGE_BODY_MAX, HTTPTransport, HTTPTransportConfig, JSONRPCProtocol,
+    _read_body, httptools
+)
+
+
+def free_port():
+    """Return a TCP port that is currently free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
 
 class TestHTTPTransport(unittest.TestCase):
     """Test HTTP transport implementation and Docker configuration."""
@@ -101,6 +122,320 @@ class TestHTTPTransport(unittest.TestCase):
         # Should have health endpoint
         self.assertIn("/health", content)
 
+    def test_config_rejects_invalid_workers(self):
+        """Test worker counts the transport cannot serve are rejected."""
+        with self.assertRaises(ValueError):
+            HTTPTransportConfig(workers=0)
+        with self.assertRaises(ValueError):
+            HTTPTransportConfig(workers=2)
+        with self.assertRaises(ValueError):
+            HTTPTransportConfig(
+                workers=2, app_factory="http_server:create_app", fast_port=8081
+            )
+        config = HTTPTransportConfig(
+            workers=2, app_factory="http_server:create_app"
+        )
+        self.assertEqual(config.workers, 2)
+
+    def test_config_rejects_credentials_with_any_origin(self):
+        """Test credentials cannot be allowed for the '*' origin."""
+        with self.assertRaises(ValueError):
+            HTTPTransportConfig(cors_allow_credentials=True)
+        with self.assertRaises(ValueError):
+            HTTPTransportConfig(
+                cors_origins=["*"], cors_allow_credentials=True
+            )
+        config = HTTPTransportConfig(
+            cors_origins=["https://example.com"], cors_allow_credentials=True
+        )
+        self.assertTrue(config.cors_allow_credentials)
+
+    def test_cors_headers(self):
+        """Test default CORS allows any origin but not credentials."""
+        client = TestClient(HTTPTransport(HTTPTransportConfig()).app)
+        response = client.get(
+            "/health", headers={"Origin": "https://example.com"}
+        )
+        self.assertEqual(response.headers["access-control-allow-origin"], "*")
+        self.assertNotIn("access-control-allow-credentials", response.headers)
+
+    def test_empty_cors_origins_skip_middleware(self):
+        """Test an empty origin list leaves CORS handling out entirely."""
+        transport = HTTPTransport(HTTPTransportConfig(cors_origins=[]))
+        self.assertEqual(transport.app.user_middleware, [])
+        response = TestClient(transport.app).get(
+            "/health", headers={"Origin": "https://example.com"}
+        )
+        self.assertNotIn("access-control-allow-origin", response.headers)
+
+    def test_run_serves_fast_port(self):
+        """Test run() goes through start(), which serves the fast port."""
+        async def handler(body):
+            return body
+
+        transport = HTTPTransport(HTTPTransportConfig(fast_port=8081), handler)
+        with unittest.mock.patch.object(
+            HTTPTransport, "start", new_callable=unittest.mock.AsyncMock
+        ) as start:
+            transport.run()
+        start.assert_awaited_once_with()
+
+
+def make_request(content_length, chunks):
+    """Build a request whose body arrives as the given chunks.
+
+    A content_length of None sends no Content-Length header.
+    """
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": True}
+        for chunk in chunks
+    ]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        return messages.pop(0)
+
+    headers = []
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {"type": "http", "method": "POST", "path": "/mcp", "headers": headers}
+    return Request(scope, receive)
+
+
+class TestReadBody(unittest.IsolatedAsyncioTestCase):
+    """Test reading request bodies within the size limit."""
+
+    async def test_large_body_is_read_whole(self):
+        """Test a body over 64 KiB arrives intact across chunks."""
+        body = bytes(range(256)) * 400
+        chunks = [body[i:i + 4096] for i in range(0, len(body), 4096)]
+        self.assertEqual(
+            await _read_body(make_request(len(body), chunks)), body
+        )
+
+    async def test_body_longer_than_content_length_is_rejected(self):
+        """Test a body overflowing its Content-Length raises ValueError."""
+        body = b"x" * (100 * 1024)
+        with self.assertRaises(ValueError):
+            await _read_body(make_request(len(body) - 1, [body]))
+
+    async def test_body_shorter_than_content_length_is_truncated(self):
+        """Test a short body is returned without trailing padding."""
+        body = b"x" * (100 * 1024)
+        self.assertEqual(
+            await _read_body(make_request(len(body) + 10, [body])), body
+        )
+
+    async def test_oversized_bodies_are_rejected(self):
+        """Test declared and streamed bodies over the limit raise a 413."""
+        with self.assertRaises(HTTPException) as raised:
+            await _read_body(make_request(LARGE_BODY_MAX + 1, []))
+        self.assertEqual(raised.exception.status_code, 413)
+
+        with unittest.mock.patch("http_transport.LARGE_BODY_MAX", 8):
+            with self.assertRaises(HTTPException) as raised:
+                await _read_body(make_request(None, [b"12345", b"67890"]))
+        self.assertEqual(raised.exception.status_code, 413)
+        self.assertEqual(
+            await _read_body(make_request(None, [b"12", b"34"])), b"1234"
+        )
+
+
+@unittest.skipIf(httptools is None, "httptools is not installed")
+class TestJSONRPCProtocol(unittest.IsolatedAsyncioTestCase):
+    """Test the bare httptools server for POST /mcp."""
+
+    async def asyncSetUp(self):
+        """Serve an echo handler on a free port."""
+        async def handler(body):
+            await asyncio.sleep(0.05 if b"slow" in body else 0)
+            return body
+
+        self.server = await asyncio.get_running_loop().create_server(
+            lambda: JSONRPCProtocol(handler), "127.0.0.1", 0
+        )
+        port = self.server.sockets[0].getsockname()[1]
+        self.reader, self.writer = await asyncio.open_connection(
+            "127.0.0.1", port
+        )
+
+    async def asyncTearDown(self):
+        """Close the connection and server."""
+        self.writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def send(self, method, path, body=b""):
+        """Write one HTTP request."""
+        self.writer.write(
+            b"%s %s HTTP/1.1\r\nHost: test\r\nContent-Length: %d\r\n\r\n%s"
+            % (method, path, len(body), body)
+        )
+
+    async def receive(self):
+        """Read one HTTP response and return its status line and body."""
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status = head.split(b"\r\n", 1)[0]
+        length = int(head.lower().split(b"content-length: ")[1].split(b"\r\n")[0])
+        return status, await self.reader.readexactly(length)
+
+    async def test_post_mcp_returns_handler_result(self):
+        """Test the body is passed to the handler and its reply returned."""
+        self.send(b"POST", b"/mcp", b'{"id":1}')
+        self.assertEqual(
+            await self.receive(), (b"HTTP/1.1 200 OK", b'{"id":1}')
+        )
+
+    async def test_pipelined_responses_keep_order(self):
+        """Test a slow request is answered before a later fast one."""
+        self.send(b"POST", b"/mcp", b'{"id":"slow"}')
+        self.send(b"POST", b"/mcp", b'{"id":"fast"}')
+        self.assertEqual((await self.receive())[1], b'{"id":"slow"}')
+        self.assertEqual((await self.receive())[1], b'{"id":"fast"}')
+
+    async def test_continue_waits_for_earlier_replies(self):
+        """Test 100 Continue is not sent ahead of a pipelined reply."""
+        self.send(b"POST", b"/mcp", b'{"id":"slow"}')
+        self.writer.write(
+            b"POST /mcp HTTP/1.1\r\nHost: test\r\nExpect: 100-continue\r\n"
+            b"Content-Length: 8\r\n\r\n{\"id\":1}"
+        )
+        self.assertEqual((await self.receive())[1], b'{"id":"slow"}')
+        self.assertEqual(
+            await self.reader.readuntil(b"\r\n\r\n"),
+            b"HTTP/1.1 100 Continue\r\n\r\n"
+        )
+        self.assertEqual((await self.receive())[1], b'{"id":1}')
+
+    async def test_other_routes_are_rejected(self):
+        """Test only POST /mcp is served."""
+        self.send(b"GET", b"/mcp")
+        self.assertEqual(
+            (await self.receive())[0], b"HTTP/1.1 405 Method Not Allowed"
+        )
+        self.send(b"POST", b"/health")
+        self.assertEqual((await self.receive())[0], b"HTTP/1.1 404 Not Found")
+
+    async def test_oversized_bodies_are_rejected(self):
+        """Test declared and streamed bodies over the limit get a 413."""
+        with unittest.mock.patch.object(JSONRPCProtocol, "max_body", 8):
+            self.send(b"POST", b"/mcp", b'{"id":"too long"}')
+            self.assertEqual(
+                await self.receive(), (
+                    b"HTTP/1.1 413 Payload Too Large",
+                    b'{"error":"Request body too large"}'
+                )
+            )
+            self.assertEqual(await self.reader.read(), b"")
+
+            reader, writer = await asyncio.open_connection(
+                "127.0.0.1", self.server.sockets[0].getsockname()[1]
+            )
+            writer.write(
+                b"POST /mcp HTTP/1.1\r\nHost: test\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\n"
+                b"5\r\n{\"id\"\r\n5\r\n:1234\r\n"
+            )
+            head = await reader.readuntil(b"\r\n\r\n")
+            self.assertTrue(head.startswith(b"HTTP/1.1 413 "))
+            writer.close()
+
+    async def test_pipelined_backlog_is_bounded(self):
+        """Test requests beyond the pipelining cap are refused."""
+        with unittest.mock.patch.object(JSONRPCProtocol, "max_pipelined", 2):
+            # One write, so the server parses all three in a single read
+            self.writer.write(3 * (
+                b"POST /mcp HTTP/1.1\r\nHost: test\r\n"
+                b"Content-Length: 13\r\n\r\n{\"id\":\"slow\"}"
+            ))
+            self.assertEqual((await self.receive())[0], b"HTTP/1.1 200 OK")
+            self.assertEqual((await self.receive())[0], b"HTTP/1.1 200 OK")
+            self.assertEqual(
+                (await self.receive())[0], b"HTTP/1.1 503 Service Unavailable"
+            )
+            self.assertEqual(await self.reader.read(), b"")
+
+    async def test_idle_connections_are_closed(self):
+        """Test a keep-alive connection with nothing in flight times out."""
+        with unittest.mock.patch.object(JSONRPCProtocol, "idle_timeout", 0.1):
+            reader, writer = await asyncio.open_connection(
+                "127.0.0.1", self.server.sockets[0].getsockname()[1]
+            )
+            writer.write(
+                b"POST /mcp HTTP/1.1\r\nHost: test\r\n"
+                b"Content-Length: 13\r\n\r\n{\"id\":\"slow\"}"
+            )
+            # A slow reply outlasting the timeout still arrives
+            head = await reader.readuntil(b"\r\n\r\n")
+            self.assertTrue(head.startswith(b"HTTP/1.1 200 OK"))
+            await reader.readexactly(13)
+            self.assertEqual(
+                await asyncio.wait_for(reader.read(), timeout=1), b""
+            )
+            writer.close()
+
+
+class TestHTTPTransportServer(unittest.IsolatedAsyncioTestCase):
+    """Test the transport served by start()."""
+
+    async def asyncSetUp(self):
+        """Serve an echo handler on free ports."""
+        async def handler(body):
+            return bytes(body)
+
+        self.port = free_port()
+        self.fast_port = free_port() if httptools else None
+        self.transport = HTTPTransport(
+            HTTPTransportConfig(
+                host="127.0.0.1", port=self.port, fast_port=self.fast_port
+            ),
+            handler
+        )
+        self.server_task = asyncio.ensure_future(self.transport.start())
+        for _ in range(100):
+            try:
+                _, writer = await asyncio.open_connection(
+                    "127.0.0.1", self.port
+                )
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.05)
+
+    async def asyncTearDown(self):
+        """Stop serving."""
+        self.server_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.server_task
+
+    async def test_close_streams_ends_sse(self):
+        """Test close_streams() finishes open SSE responses."""
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /mcp/stream HTTP/1.1\r\nHost: test\r\n\r\n")
+        head = await reader.readuntil(b"\r\n\r\n")
+        self.assertIn(b"text/event-stream", head)
+        while not self.transport._sse_clients:
+            await asyncio.sleep(0.01)
+
+        self.transport.close_streams()
+        await asyncio.wait_for(reader.readuntil(b"0\r\n\r\n"), timeout=2)
+        writer.close()
+
+    @unittest.skipIf(httptools is None, "httptools is not installed")
+    async def test_fast_port_serves_mcp(self):
+        """Test start() also serves POST /mcp on the fast port."""
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", self.fast_port
+        )
+        writer.write(
+            b"POST /mcp HTTP/1.1\r\nHost: test\r\n"
+            b"Content-Length: 8\r\n\r\n{\"id\":1}"
+        )
+        head = await reader.readuntil(b"\r\n\r\n")
+        self.assertTrue(head.startswith(b"HTTP/1.1 200 OK"))
+        self.assertEqual(await reader.readexactly(8), b'{"id":1}')
+        writer.close()
+
 
 if __name__ == '__main__':
     unittest.main()